@@ -9,6 +9,23 @@ load_dotenv()
 
 app = Flask(__name__)
 
+# --- Filter-parsing patterns (compiled once at import) ---
+# All numeric filters share one alternation so the message is scanned once.
+# Each branch has a single named group, reported by match.lastgroup. Branch
+# order matters where prefixes overlap: "over 500 votes" must be read as a
+# vote count, not a runtime.
+FILTERS_RE = re.compile("|".join([
+    r"\b(?:after|since|from)\s+(?P<after>\d{4})\b",
+    r"\b(?:before|until|upto)\s+(?P<before>\d{4})\b",
+    r"\b(?:at least|min(?:imum)?|over)\s+(?P<min_votes>\d+)\s*votes?\b",
+    r"\b(?:at least|min(?:imum)?|over)\s+(?P<min_runtime>\d+)\s*(?:minutes|min|mins)?\b",
+    r"\b(?:under|less than|max(?:imum)?|up to)\s+(?P<max_runtime>\d+)\s*(?:minutes|min|mins)?\b",
+    r"\b(?:rated|rating)\s+(?:above|over|at least|higher than)\s+(?P<min_rating>[0-9.]+)\b",
+    # "highly/top rated" only consumes the adjective, leaving "rated above 8" to the branch above
+    r"\b(?P<good>good|great|highly(?=[- ]rated\b)|top(?=[- ]rated\b)|best|awesome|fantastic)\b",
+]))
+EXCLUDED_RE = re.compile(r"\b(?:but not|excluding|without)\s+(.+)")
+
 recommender = None
 try:
     print("Initializing recommender...")
@@ -18,6 +35,42 @@ except Exception as e:
     print(f"ERROR: Failed to initialize MovieRecommender: {e}")
     traceback.print_exc()
 
+def _trie_pattern(words):
+    """Compiles a word list into a trie-shaped regex alternation.
+
+    Shared prefixes are factored out (e.g. 'war|western' -> 'w(?:ar|estern)'),
+    so the regex engine scans the message once for the whole vocabulary.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = None # End-of-word marker
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        pattern = '(?:' + '|'.join(branches) + ')'
+        return pattern + '?' if '' in node else pattern
+
+    return build(trie) or '(?!)' # Empty vocabulary never matches
+
+
+# Genre / language unions depend on the TMDb vocabulary, so they are built
+# once after the recommender has loaded it. Matching runs on the lowercased
+# message; the *_BY_LOWER maps restore the display names.
+GENRE_BY_LOWER = {}
+LANGUAGE_BY_LOWER = {}
+if recommender is not None:
+    GENRE_BY_LOWER = {g.lower(): g for g in recommender.genres_list}
+    LANGUAGE_BY_LOWER = {lang_name.lower(): lang_name for lang_name in recommender.languages_list}
+GENRE_UNION = re.compile(r'\b(?:' + _trie_pattern(GENRE_BY_LOWER) + r')\b')
+LANG_UNION = re.compile(r'\b(?:' + _trie_pattern(LANGUAGE_BY_LOWER) + r')\b')
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -43,77 +96,47 @@ def get_bot_response():
     excluded_genres = []
 
 
-    # Parse Genres (MODIFIED)
-    user_msg_for_genre_parsing = user_msg # Work on a copy
-    sorted_genres = sorted(recommender.genres_list, key=len, reverse=True) # Sort by length descending to match longer names first
-
-    for g in sorted_genres:
-        # Use regex with word boundaries to find the genre name
-        # Check if the genre name exists in the remaining part of the message
-        genre_pattern = r'\b' + re.escape(g.lower()) + r'\b'
-        if re.search(genre_pattern, user_msg_for_genre_parsing):
-            genres.append(g)
-            # Replace the found genre name (and potential connecting words)
-            # with a placeholder or space to prevent re-matching or interference
-            # This is a heuristic and might not be perfect for all sentence structures
-            user_msg_for_genre_parsing = re.sub(
-                r"(?:\b(?:and|or|,)\s+)?(?:" + genre_pattern + r")",
-                " ", # Replace with space
-                user_msg_for_genre_parsing
-            ).strip()
-
-
-    # Parse Year Constraints (keep existing logic)
-    after_match = re.search(r"\b(after|since|from)\s+(\d{4})\b", user_msg)
-    if after_match: after = int(after_match.group(2))
-
-    before_match = re.search(r"\b(before|until|upto)\s+(\d{4})\b", user_msg)
-    if before_match: before = int(before_match.group(2))
-
-    # Parse Runtime Constraints (keep existing logic)
-    min_runtime_match = re.search(r"\b(at least|min(?:imum)?|over)\s+(\d+)\s*(?:minutes|min|mins)?\b", user_msg)
-    if min_runtime_match: min_runtime = int(min_runtime_match.group(2))
-
-    max_runtime_match = re.search(r"\b(?:under|less than|max(?:imum)?|up to)\s+(\d+)\s*(?:minutes|min|mins)?\b", user_msg)
-    if max_runtime_match: max_runtime = int(max_runtime_match.group(2))
-
-    # Parse Rating Constraints (keep existing logic)
-    rating_match = re.search(r"\b(rated|rating)\s+(above|over|at least|higher than)\s+([0-9.]+)\b", user_msg)
-    if rating_match:
-        try: min_rating = float(rating_match.group(3))
+    # Parse Genres and Excluded Genres (MODIFIED)
+    # Most messages name no genre at all, so a plain substring test gates the
+    # regex work. When a name is present, one scan finds every genre with word
+    # boundaries (the trie alternation prefers the longest name at each
+    # position). finditer never overlaps, so each mention is seen exactly once;
+    # mentions inside the "but not / excluding / without" clause are excluded
+    # genres, the rest are requested genres.
+    if any(gl in user_msg for gl in GENRE_BY_LOWER):
+        excluded_match = EXCLUDED_RE.search(user_msg)
+        excluded_start = excluded_match.start(1) if excluded_match else len(user_msg)
+        for m in GENRE_UNION.finditer(user_msg):
+            g = GENRE_BY_LOWER[m.group(0)]
+            target = excluded_genres if m.start() >= excluded_start else genres
+            if g not in target:
+                target.append(g)
+
+
+    # Parse Year / Runtime / Rating / Vote Constraints (and "good" wording) in one pass
+    # The first mention of each filter wins, as with the old per-filter searches
+    filter_values = {}
+    for m in FILTERS_RE.finditer(user_msg):
+        filter_values.setdefault(m.lastgroup, m.group(m.lastgroup))
+
+    if 'after' in filter_values: after = int(filter_values['after'])
+    if 'before' in filter_values: before = int(filter_values['before'])
+    if 'min_runtime' in filter_values: min_runtime = int(filter_values['min_runtime'])
+    if 'max_runtime' in filter_values: max_runtime = int(filter_values['max_runtime'])
+    if 'min_votes' in filter_values: min_votes = int(filter_values['min_votes'])
+
+    if 'min_rating' in filter_values:
+        try: min_rating = float(filter_values['min_rating'])
         except ValueError: pass
     elif min_rating is None and (
-        re.search(r'\b(good|great|highly rated|highly-rated|top rated|top-rated|best|awesome|fantastic)\b', user_msg) or
+        'good' in filter_values or
         (genres and len(genres) > 0) # Assume higher rating desired if genres are specified
     ):
          min_rating = 7.0 # Default threshold for "good" or when specific genres are asked for
 
     # Parse Language (keep existing logic)
-    sorted_languages = sorted(recommender.languages_list, key=len, reverse=True)
-    for lang_name in sorted_languages:
-        if re.search(r'\b(?:in|language)?\s*' + re.escape(lang_name.lower()) + r'\b', user_msg):
-            language = lang_name
-            break
-
-    # Parse Minimum Vote Count (keep existing logic)
-    min_votes_match = re.search(r"\b(?:at least|min(?:imum)?|over)\s+(\d+)\s*votes?\b", user_msg)
-    if min_votes_match: min_votes = int(min_votes_match.group(1))
-
-    # Parse Excluded Genres (keep existing logic - uses the original user_msg)
-    excluded_match = re.search(r"\b(?:but not|excluding|without)\s+(.+)", user_msg)
-    if excluded_match:
-        excluded_text = excluded_match.group(1)
-        potential_excluded_genres = re.split(r",\s*| and ", excluded_text)
-
-        for excluded_part in potential_excluded_genres:
-             excluded_part = excluded_part.strip()
-             if not excluded_part: continue
-
-             for g in sorted_genres:
-                 if re.search(r'\b' + re.escape(g.lower()) + r'\b', excluded_part):
-                     excluded_genres.append(g)
-                     # No need to modify excluded_text here, as we only parse this part once
-
+    lang_match = LANG_UNION.search(user_msg)
+    if lang_match: language = LANGUAGE_BY_LOWER[lang_match.group(0)]
 
     print(f"Parsed filters: genres={genres}, after={after}, before={before}, min_runtime={min_runtime}, max_runtime={max_runtime}, min_rating={min_rating}, language={language}, min_votes={min_votes}, excluded_genres={excluded_genres}")
 
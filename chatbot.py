@@ -1,14 +1,27 @@
-import pandas as pd
 import os
+import json
 import re
 import random
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import traceback
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cachetools import TTLCache
 
 load_dotenv()
 
+# Genre and language lists are cached here as JSON between restarts
+DATA_FOLDER = os.getenv("DATA_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+METADATA_MAX_AGE = 24 * 60 * 60 # Seconds before the cached TMDb metadata is refetched
+
+# The only /discover/movie fields recommend() reads; everything else is dropped on parse
+MOVIE_FIELDS = ('id', 'title', 'release_date', 'vote_average', 'genre_ids', 'poster_path', 'overview')
+
 class MovieRecommender:
     def __init__(self):
         print("Initializing recommender (API mode)...")
@@ -21,32 +34,100 @@ class MovieRecommender:
             self.languages = {}
             self.image_base_url = "https://image.tmdb.org/t/p/"
             self.image_size = "w185"
+            self._genres_list = []
+            self._languages_list = []
+            self._id_to_genre_name = {}
 
             print("API not available. Recommender limited.")
             return
         else:
             self.api_available = True
 
-        self.genres = self._get_tmdb_genres()
-        self.languages = self._get_language_codes()
+        # One pooled keep-alive session for every TMDb call (genres, languages, discover pages).
+        # Rate limiting (429) and transient 5xx errors are retried with backoff,
+        # honouring TMDb's Retry-After header.
+        self._session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+
+        # Genres and languages are independent lookups, so load them in parallel
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            genres_future = executor.submit(self._load_cached_metadata, "tmdb_genres.json", self._get_tmdb_genres)
+            languages_future = executor.submit(self._load_cached_metadata, "tmdb_languages.json", self._get_language_codes)
+            self.genres = genres_future.result()
+            self.languages = languages_future.result()
         print(f"Loaded {len(self.genres)} genres and {len(self.languages)} languages from TMDb.")
 
+        # Display-name lists never change after loading, so sort them once here
+        self._genres_list = sorted(name.capitalize() for name in self.genres)
+        self._languages_list = sorted(name.capitalize() for name in self.languages)
+        self._id_to_genre_name = {gid: name.capitalize() for name, gid in self.genres.items()}
+
         self.image_base_url = "https://image.tmdb.org/t/p/"
         self.image_size = "w185"
 
         self.max_api_pages_to_fetch = 5
-        self.delay_between_pages = 0.1
+        self.max_concurrent_page_requests = 4
+
+        # Discover results keyed by the normalized query params (api_key excluded)
+        self._discover_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._discover_cache_lock = threading.Lock()
 
 
         print("Recommender initialized (API mode).")
 
 
+    def _get(self, url, params=None):
+        """GETs a TMDb URL on the shared session and raises for HTTP errors (after the adapter's retries)."""
+        response = self._session.get(url, params=params)
+        response.raise_for_status()
+        return response
+
+
+    def _load_cached_metadata(self, filename, fetch):
+        """
+        Returns TMDb metadata from its JSON cache in DATA_FOLDER.
+        A stale cache is still served while a background thread refreshes the
+        file (stale-while-revalidate); fetch() is only waited on when there is
+        no usable cache at all.
+        """
+        path = os.path.join(DATA_FOLDER, filename)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+
+        if not data:
+            return self._refresh_cached_metadata(path, fetch)
+
+        if age >= METADATA_MAX_AGE:
+            print(f"TMDb metadata cache {path} is stale, refreshing in the background.")
+            threading.Thread(target=self._refresh_cached_metadata, args=(path, fetch), daemon=True).start()
+        return data
+
+
+    def _refresh_cached_metadata(self, path, fetch):
+        """Calls fetch() and atomically rewrites the JSON cache at path if it returned data."""
+        data = fetch()
+        if data:
+            try:
+                os.makedirs(DATA_FOLDER, exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: could not write TMDb metadata cache {path}: {e}")
+        return data
+
+
     def _get_tmdb_genres(self):
         """Fetches movie genre list from TMDb API."""
         url = f"https://api.themoviedb.org/3/genre/movie/list?api_key={self.tmdb_api_key}&language=en-US"
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            response = self._get(url)
             data = response.json()
             if 'genres' in data:
                 return {genre['name'].lower(): genre['id'] for genre in data['genres']}
@@ -62,8 +143,7 @@ class MovieRecommender:
         """Fetches supported languages list from TMDb API."""
         url = f"https://api.themoviedb.org/3/configuration/languages?api_key={self.tmdb_api_key}"
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            response = self._get(url)
             data = response.json()
             return {lang['english_name'].lower(): lang['iso_639_1'] for lang in data if lang.get('english_name')}
         except requests.exceptions.RequestException as e:
@@ -71,6 +151,85 @@ class MovieRecommender:
             return {}
 
 
+    @staticmethod
+    def _project_movies(results):
+        """Keeps only MOVIE_FIELDS from each raw discover result."""
+        return [{k: movie[k] for k in MOVIE_FIELDS if k in movie} for movie in results]
+
+
+    def _fetch_discover_pages(self, params, cache_key):
+        """
+        Fetches up to max_api_pages_to_fetch pages from /discover/movie.
+        Page 1 is fetched on its own to learn total_pages; the remaining pages
+        are then requested concurrently over the shared session.
+        Returns the combined movie list, or None if the first page failed.
+        """
+        api_url = "https://api.themoviedb.org/3/discover/movie"
+        all_movies_list = []
+        fetched_pages = 0
+        complete = True
+
+        print(f"Starting API multi-page fetch for params: {params}")
+
+        try:
+            print("Fetching page 1...")
+            data = orjson.loads(self._get(api_url, params={**params, 'page': 1}).content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            print(f"API request failed while fetching page 1: {e}")
+            traceback.print_exc()
+            return None
+
+        if 'results' in data and data['results']:
+            all_movies_list.extend(self._project_movies(data['results']))
+            fetched_pages = 1
+            total_pages = data.get('total_pages', 1)
+            print(f"Fetched {len(data['results'])} results from page 1. Total pages available: {total_pages}.")
+
+            pages_needed = min(self.max_api_pages_to_fetch, total_pages)
+            if pages_needed > 1:
+                page_results = {}
+                workers = min(self.max_concurrent_page_requests, pages_needed - 1)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {
+                        executor.submit(self._get, api_url, {**params, 'page': page}): page
+                        for page in range(2, pages_needed + 1)
+                    }
+                    for future in as_completed(futures):
+                        page = futures[future]
+                        try:
+                            page_data = orjson.loads(future.result().content)
+                        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+                            print(f"API request failed while fetching page {page}: {e}. Continuing with partial data.")
+                            complete = False
+                            continue
+
+                        if page_data.get('results'):
+                            page_results[page] = self._project_movies(page_data['results'])
+                            print(f"Fetched {len(page_data['results'])} results from page {page}.")
+                        else:
+                            print(f"Page {page} returned no results or an unexpected format.")
+
+                # Keep TMDb's page order regardless of completion order
+                for page in sorted(page_results):
+                    all_movies_list.extend(page_results[page])
+                fetched_pages += len(page_results)
+
+        elif 'results' in data:
+            print("Page 1 returned no results.")
+
+        else:
+            print("Page 1 response format unexpected.")
+            complete = False
+
+        print(f"Finished fetching. Total movies collected across {fetched_pages} pages: {len(all_movies_list)}")
+
+        # Partial results are still served, but only a complete fetch is cached
+        if complete:
+            with self._discover_cache_lock:
+                self._discover_cache[cache_key] = all_movies_list
+        return all_movies_list
+
+
     # Recommend method updated to accept a list of genres
     def recommend(self, genres=None, after=None, before=None, min_runtime=None, max_runtime=None, min_rating=None, language=None, min_votes=None, excluded_genres=None):
         """
@@ -161,57 +320,20 @@ class MovieRecommender:
                   # Optionally, you could return an error to the user here as well
 
 
-        # --- Fetch Multiple Pages from API ---
-        # ... (This logic remains the same) ...
-        api_url = "https://api.themoviedb.org/3/discover/movie"
-        all_movies_list = []
-        total_pages = 1
-        fetched_pages = 0
-
-        print(f"Starting API multi-page fetch for params: {params}")
-
-        while fetched_pages < self.max_api_pages_to_fetch and fetched_pages < total_pages:
-            page = fetched_pages + 1
-            current_params = params.copy()
-            current_params['page'] = page
-
-            try:
-                print(f"Fetching page {page}...")
-                response = requests.get(api_url, params=current_params)
-                response.raise_for_status()
-                data = response.json()
-
-                if 'results' in data and data['results']:
-                    all_movies_list.extend(data['results'])
-                    total_pages = data.get('total_pages', total_pages)
-                    fetched_pages += 1
-                    print(f"Fetched {len(data['results'])} results from page {page}. Total results so far: {len(all_movies_list)}. Total pages available: {total_pages}.")
-
-                    if fetched_pages < self.max_api_pages_to_fetch and fetched_pages < total_pages:
-                         time.sleep(self.delay_between_pages)
-
-                elif 'results' in data and not data['results']:
-                     print(f"Page {page} returned no results. Stopping pagination.")
-                     break
-
-                else:
-                    print(f"Page {page} response format unexpected. Stopping pagination.")
-                    break
-
-
-            except requests.exceptions.RequestException as e:
-                print(f"API request failed while fetching page {page}: {e}")
-                traceback.print_exc()
-                if not all_movies_list:
-                     return {
-                         "recommendations": [],
-                         "note": "Sorry, I'm having trouble fetching movie data from the API right now."
-                     }
-                else:
-                     print("Continuing with partial data due to API error.")
-                     break
-
-        print(f"Finished fetching. Total movies collected across {fetched_pages} pages: {len(all_movies_list)}")
+        # --- Fetch Multiple Pages from API (or reuse a cached fetch) ---
+        cache_key = tuple(sorted((k, v) for k, v in params.items() if k != 'api_key'))
+        with self._discover_cache_lock:
+            cached_movies = self._discover_cache.get(cache_key)
+        if cached_movies is not None:
+            print(f"Using {len(cached_movies)} cached movies for params: {dict(cache_key)}")
+            all_movies_list = cached_movies
+        else:
+            all_movies_list = self._fetch_discover_pages(params, cache_key)
+            if all_movies_list is None:
+                return {
+                    "recommendations": [],
+                    "note": "Sorry, I'm having trouble fetching movie data from the API right now."
+                }
 
         # --- Post-processing and Sampling from the combined list ---
         # ... (This logic remains the same, handling empty results and sampling) ...
@@ -221,44 +343,42 @@ class MovieRecommender:
                  "note": "Sorry, I couldn't find any movies matching all your criteria from the API."
              }
 
-        df_results = pd.DataFrame(all_movies_list)
-
-        if 'id' in df_results.columns:
-             df_results = df_results.drop_duplicates(subset=['id'])
-             print(f"After removing duplicates: {len(df_results)} unique movies.")
+        # Drop duplicate movies (pages can overlap); dict keys keep first-seen order
+        unique_movies = list({m.get('id'): m for m in all_movies_list}.values())
+        print(f"After removing duplicates: {len(unique_movies)} unique movies.")
 
-        if df_results.empty:
+        if not unique_movies:
              return {
                  "recommendations": [],
                  "note": "Sorry, no unique movies found matching your criteria after post-processing API results."
              }
 
-        sample_size = min(5, len(df_results))
-
-        if sample_size > 0:
-             sample = df_results.sample(n=sample_size, random_state=random.randint(1, 10000))
+        # A pool that already fits in one reply is returned as-is, without sampling
+        if len(unique_movies) <= 5:
+             sample = unique_movies
         else:
-             return {
-                  "recommendations": [],
-                  "note": "Found matching movies, but couldn't select a sample."
-             }
+             sample = random.sample(unique_movies, 5)
 
 
         # --- Prepare Structured Output for Frontend ---
         recommendation_data = []
-        for _, row in sample.iterrows():
+        id_to_genre_name = self._id_to_genre_name
+        for row in sample:
+            # Read each field once; the year is the "YYYY" prefix of the ISO release date
+            release_date = row.get('release_date')
+            vote_average = row.get('vote_average')
             genre_names = [
-                name.capitalize()
-                for name, id in self.genres.items()
-                if id in row.get('genre_ids', [])
+                id_to_genre_name[gid]
+                for gid in row.get('genre_ids') or ()
+                if gid in id_to_genre_name
             ]
             genre_str = ", ".join(genre_names) if genre_names else "Unknown Genre"
 
             recommendation_data.append({
                 "id": row.get('id'),
                 "name": row.get('title', 'N/A'),
-                "year": row.get('release_date', 'N/A').split('-')[0] if row.get('release_date') else 'N/A',
-                "rating": f"{row.get('vote_average'):.1f}" if row.get('vote_average') is not None else 'N/A',
+                "year": release_date[:4] if release_date else 'N/A',
+                "rating": f"{vote_average:.1f}" if vote_average is not None else 'N/A',
                 "genres": genre_str, # This is the combined string for display
                 "poster_path": row.get('poster_path'),
                 "overview": row.get('overview', 'No overview available.'),
@@ -285,8 +405,8 @@ class MovieRecommender:
         elif not recommendation_data:
              rating_note = " (No movies found matching criteria from API)"
         else:
-             sample_min_rating = sample['vote_average'].min() if 'vote_average' in sample.columns else None
-             if pd.notna(sample_min_rating) and sample_min_rating > 0:
+             sample_min_rating = min((m['vote_average'] for m in sample if m.get('vote_average') is not None), default=None)
+             if sample_min_rating is not None and sample_min_rating > 0:
                   rating_note = f" (Showing recommendations rated {sample_min_rating:.1f} or higher from API)"
              else:
                   rating_note = " (Showing matching movies from API)"
@@ -302,13 +422,9 @@ class MovieRecommender:
     @property
     def genres_list(self):
         """Returns a sorted list of available genre names."""
-        if not self.genres:
-            return []
-        return sorted([name.capitalize() for name in self.genres.keys()])
+        return self._genres_list
 
     @property
     def languages_list(self):
         """Returns a sorted list of available language names."""
-        if not self.languages:
-             return []
-        return sorted([name.capitalize() for name in self.languages.keys()])
\ No newline at end of file
+        return self._languages_list
\ No newline at end of file